@@ -1,415 +1,688 @@
-import os
-import pandas as pd
-import random
-import re
-from datetime import date, datetime
-from collections import OrderedDict
-from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from google.cloud import bigquery
-from google.api_core.exceptions import NotFound
-
-# --- BigQuery Configuration ---
-try:
-    client = bigquery.Client()
-    PROJECT_ID = client.project
-    DATASET_ID = "smashers_data"
-except Exception as e:
-    print("ERROR: Could not initialize BigQuery client.")
-    print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set correctly.")
-    client = None
-
-# Define table IDs
-PLAYERS_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.players"
-MATCHES_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.matches"
-ATTENDANCE_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.attendance"
-
-app = Flask(__name__, template_folder='templates', static_folder='../static')
-app.secret_key = 'a_very_secret_and_secure_key_for_dev_v20_final'
-
-# --- Helper Functions ---
-DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
-USERS_FILE = os.path.join(DATA_DIR, 'users.csv')
-
-def read_csv(file_path):
-    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
-        return pd.DataFrame(columns=['username', 'password', 'role'])
-    return pd.read_csv(file_path)
-
-def write_csv(df, file_path):
-    df.to_csv(file_path, index=False)
-
-def generate_remark(score):
-    if not score or not isinstance(score, str): return ""
-    try:
-        games = [int(g) for g in re.findall(r'\d+', score)];
-        if len(games) < 2 or len(games) % 2 != 0: return ""
-        team1_total = sum(games[::2]); team2_total = sum(games[1::2]);
-        difference = abs(team1_total - team2_total)
-        if difference <= 2: return "Nice Close Game!"
-        elif difference <= 5: return "Well Fought Match!"
-        else: return "Decisive Victory!"
-    except (ValueError, TypeError): return ""
-
-def get_all_players():
-    try:
-        query = f"SELECT * FROM `{PLAYERS_TABLE_ID}`"
-        return client.query(query).to_dataframe()
-    except (NotFound, Exception):
-        return pd.DataFrame(columns=['username', 'name', 'age', 'gender', 'wins', 'losses'])
-
-def get_all_matches():
-    try:
-        query = f"SELECT * FROM `{MATCHES_TABLE_ID}`"
-        return client.query(query).to_dataframe()
-    except (NotFound, Exception):
-        return pd.DataFrame(columns=['male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type', 'status', 'winner_team', 'score', 'remark'])
-
-def get_all_attendance():
-    try:
-        query = f"SELECT * FROM `{ATTENDANCE_TABLE_ID}`"
-        return client.query(query).to_dataframe()
-    except (NotFound, Exception):
-        return pd.DataFrame(columns=['date', 'present_players'])
-
-
-@app.route('/')
-def index(): return render_template('index.html')
-
-@app.route('/register', methods=['GET', 'POST'])
-def register():
-    if request.method == 'POST':
-        users_df, players_df = read_csv(USERS_FILE), get_all_players()
-        username, password, name, age, gender = request.form['username'], request.form['password'], request.form['name'], request.form['age'], request.form['gender']
-        if username in users_df['username'].values or (not players_df.empty and username in players_df['username'].values):
-            flash('Username already exists!', 'error'); return redirect(url_for('register'))
-        hashed_password = generate_password_hash(password)
-        new_user = pd.DataFrame([[username, hashed_password, 'player']], columns=['username', 'password', 'role'])
-        write_csv(pd.concat([users_df, new_user], ignore_index=True), USERS_FILE)
-        new_player_row = [{"username": username, "name": name, "age": int(age), "gender": gender, "wins": 0, "losses": 0}]
-        errors = client.insert_rows_json(PLAYERS_TABLE_ID, new_player_row)
-        if errors:
-            flash(f'Error saving player data: {errors}', 'error'); return redirect(url_for('register'))
-        flash('Registration successful! Please log in.', 'success'); return redirect(url_for('login'))
-    return render_template('register.html')
-
-@app.route('/login', methods=['GET', 'POST'])
-def login():
-    if request.method == 'POST':
-        users_df = read_csv(USERS_FILE)
-        username, password = request.form['username'], request.form['password']
-        user = users_df[users_df['username'] == username]
-        if not user.empty and check_password_hash(user.iloc[0]['password'], password):
-            session['username'], session['role'] = username, user.iloc[0]['role']
-            return redirect(url_for('admin_dashboard' if session['role'] == 'admin' else 'dashboard'))
-        flash('Invalid username or password.', 'error'); return redirect(url_for('login'))
-    return render_template('login.html')
-
-@app.route('/logout')
-def logout():
-    session.clear(); flash('You have been logged out.', 'success'); return redirect(url_for('login'))
-
-@app.route('/dashboard')
-def dashboard():
-    if 'username' not in session or session.get('role') != 'player': return redirect(url_for('login'))
-    players_df, matches_df = get_all_players(), get_all_matches()
-    username = session['username']
-    player_data = players_df[players_df['username'] == username].iloc[0]
-    player_matches_df = matches_df[(matches_df['male_player1'] == username) | (matches_df['female_player1'] == username) | (matches_df['male_player2'] == username) | (matches_df['female_player2'] == username)]
-    player_first_names = {user: name.split()[0] for user, name in players_df.set_index('username')['name'].items()}
-    processed_matches = []
-    for _, match in player_matches_df.iterrows():
-        details = match.to_dict()
-        p1, p2, p3, p4 = match['male_player1'], match['female_player1'], match['male_player2'], match['female_player2']
-        if username in [p1, p2]:
-            details['partner_name'] = player_first_names.get(p2 if username == p1 else p1, "")
-            details['opponents_names'] = f"{player_first_names.get(p3, p3)} & {player_first_names.get(p4, p4)}"
-        else:
-            details['partner_name'] = player_first_names.get(p4 if username == p3 else p3, "")
-            details['opponents_names'] = f"{player_first_names.get(p1, p1)} & {player_first_names.get(p2, p2)}"
-        processed_matches.append(details)
-    return render_template('dashboard.html', player=player_data.to_dict(), matches=processed_matches)
-
-@app.route('/rankings')
-def rankings():
-    players_df = get_all_players()
-    if not players_df.empty:
-        players_df['win_loss_ratio'] = players_df['wins'] / (players_df['wins'] + players_df['losses']).replace(0, 1)
-        ranked_players = players_df.sort_values(by='win_loss_ratio', ascending=False)
-    else: ranked_players = pd.DataFrame()
-    return render_template('rankings.html', players=ranked_players.to_dict('records'))
-
-@app.route('/player/<username>')
-def player_profile(username):
-    players_df, matches_df = get_all_players(), get_all_matches()
-    player_data = players_df[players_df['username'] == username]
-    if player_data.empty: flash('Player not found.', 'error'); return redirect(url_for('rankings'))
-    completed_matches_df = matches_df[(matches_df['status'] == 'completed') & ((matches_df['male_player1'] == username) | (matches_df['female_player1'] == username) | (matches_df['male_player2'] == username) | (matches_df['female_player2'] == username))]
-    player_first_names = {user: name.split()[0] for user, name in players_df.set_index('username')['name'].items()}
-    processed_matches = []
-    for _, match in completed_matches_df.iterrows():
-        details = match.to_dict()
-        p1, p2, p3, p4 = match['male_player1'], match['female_player1'], match['male_player2'], match['female_player2']
-        if username in [p1, p2]:
-            details['partner_name'] = player_first_names.get(p2 if username == p1 else p1, "")
-            details['opponents_names'] = f"{player_first_names.get(p3, p3)} & {player_first_names.get(p4, p4)}"
-        else:
-            details['partner_name'] = player_first_names.get(p4 if username == p3 else p3, "")
-            details['opponents_names'] = f"{player_first_names.get(p1, p1)} & {player_first_names.get(p2, p2)}"
-        processed_matches.append(details)
-    return render_template('player_profile.html', player=player_data.iloc[0].to_dict(), matches=processed_matches)
-
-@app.route('/ongoing_matches')
-def ongoing_matches():
-    matches_df, players_df = get_all_matches(), get_all_players()
-    player_first_names = {user: name.split()[0] for user, name in players_df.set_index('username')['name'].items()}
-    today_str = date.today().strftime('%Y-%m-%d')
-    todays_ongoing_df = matches_df[(matches_df['date'] == today_str) & (matches_df['status'] == 'ongoing')]
-    todays_ongoing_list = []
-    for _, match in todays_ongoing_df.iterrows():
-        match_details = match.to_dict()
-        match_details['t1_p1_name'] = player_first_names.get(match['male_player1'], match['male_player1'])
-        match_details['t1_p2_name'] = player_first_names.get(match['female_player1'], match['female_player1'])
-        match_details['t2_p1_name'] = player_first_names.get(match['male_player2'], match['male_player2'])
-        match_details['t2_p2_name'] = player_first_names.get(match['female_player2'], match['female_player2'])
-        todays_ongoing_list.append(match_details)
-    return render_template('ongoing_matches.html', matches=todays_ongoing_list)
-
-@app.route('/history', methods=['GET', 'POST'])
-def history():
-    matches_df, players_df = get_all_matches(), get_all_players()
-    player_first_names = {user: name.split()[0] for user, name in players_df.set_index('username')['name'].items()}
-    completed_matches = matches_df[matches_df['status'] == 'completed'].copy()
-    start_date, end_date = request.form.get('start_date'), request.form.get('end_date')
-    if start_date and end_date:
-        completed_matches = completed_matches[(completed_matches['date'] >= start_date) & (completed_matches['date'] <= end_date)]
-    completed_matches = completed_matches.sort_values(by='date', ascending=False)
-    grouped_matches = OrderedDict()
-    for _, match in completed_matches.iterrows():
-        dt_obj = datetime.strptime(match['date'], '%Y-%m-%d')
-        formatted_date = dt_obj.strftime('%B %d, %Y (%A)')
-        if formatted_date not in grouped_matches: grouped_matches[formatted_date] = []
-        team1_p1 = player_first_names.get(match['male_player1'], match['male_player1'])
-        team1_p2 = player_first_names.get(match['female_player1'], match['female_player1'])
-        team2_p1 = player_first_names.get(match['male_player2'], match['male_player2'])
-        team2_p2 = player_first_names.get(match['female_player2'], match['female_player2'])
-        try:
-            scores = [int(s) for s in re.findall(r'\d+', str(match['score']))]
-            score1, score2 = (scores[0], scores[1]) if len(scores) > 1 else (scores[0], 0)
-        except (TypeError, ValueError, IndexError): score1, score2 = 0, 0
-        match_details = {'game_type': match['game_type']}
-        if match['winner_team'] == 'Team 1':
-            match_details.update({'winner_p1_name': team1_p1, 'winner_p2_name': team1_p2, 'winner_score': max(score1, score2), 'loser_p1_name': team2_p1, 'loser_p2_name': team2_p2, 'loser_score': min(score1, score2)})
-        else:
-            match_details.update({'winner_p1_name': team2_p1, 'winner_p2_name': team2_p2, 'winner_score': max(score1, score2), 'loser_p1_name': team1_p1, 'loser_p2_name': team1_p2, 'loser_score': min(score1, score2)})
-        grouped_matches[formatted_date].append(match_details)
-    return render_template('history.html', grouped_matches=grouped_matches, start_date=start_date, end_date=end_date)
-
-@app.route('/admin')
-def admin_dashboard():
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    matches_df, players_df = get_all_matches(), get_all_players()
-    player_first_names = {user: name.split()[0] for user, name in players_df.set_index('username')['name'].items()}
-    display_matches_df = matches_df[matches_df['status'] != 'completed'].reset_index()
-    title = "Manage Upcoming & Ongoing Matches"
-    display_matches_list = []
-    for _, match in display_matches_df.iterrows():
-        match_details = match.to_dict()
-        match_details['t1_p1_name'] = player_first_names.get(match['male_player1'], match['male_player1'])
-        match_details['t1_p2_name'] = player_first_names.get(match['female_player1'], match['female_player1'])
-        match_details['t2_p1_name'] = player_first_names.get(match['male_player2'], match['male_player2'])
-        match_details['t2_p2_name'] = player_first_names.get(match['female_player2'], match['female_player2'])
-        display_matches_list.append(match_details)
-    return render_template('admin_dashboard.html', matches=display_matches_list, title=title)
-
-@app.route('/admin/attendance', methods=['GET', 'POST'])
-def attendance():
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    today_str = date.today().strftime('%Y-%m-%d')
-    players_df = get_all_players()
-    if request.method == 'POST':
-        present_players = request.form.getlist('present_players')
-        present_players_str = ','.join(present_players)
-        try:
-            check_query = f"SELECT date FROM `{ATTENDANCE_TABLE_ID}` WHERE date = '{today_str}'"
-            query_job = client.query(check_query)
-            results = query_job.result()
-            if results.total_rows > 0:
-                update_query = f"""
-                    UPDATE `{ATTENDANCE_TABLE_ID}`
-                    SET present_players = '{present_players_str}'
-                    WHERE date = '{today_str}'
-                """
-                update_job = client.query(update_query)
-                update_job.result()
-            else:
-                new_record = [{"date": today_str, "present_players": present_players_str}]
-                errors = client.insert_rows_json(ATTENDANCE_TABLE_ID, new_record)
-                if errors: raise Exception(f"BigQuery Insert Errors: {errors}")
-            flash('Attendance for today has been saved!', 'success')
-        except Exception as e:
-            if "streaming buffer" in str(e):
-                 flash('Attendance is processing. Please wait a moment before saving again.', 'error')
-            else:
-                flash(f"An error occurred: {e}", "error")
-        return redirect(url_for('admin_dashboard'))
-    attendance_df = get_all_attendance()
-    male_players, female_players = players_df[players_df['gender'] == 'Male'].to_dict('records'), players_df[players_df['gender'] == 'Female'].to_dict('records')
-    today_record = attendance_df[attendance_df['date'] == today_str]
-    present_today = today_record.iloc[0]['present_players'].split(',') if not today_record.empty and pd.notna(today_record.iloc[0]['present_players']) else []
-    return render_template('attendance.html', male_players=male_players, female_players=female_players, present_today=present_today)
-
-@app.route('/admin/create_match', methods=['GET', 'POST'])
-def create_match():
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    today_str, players_df, matches_df, attendance_df = date.today().strftime('%Y-%m-%d'), get_all_players(), get_all_matches(), get_all_attendance()
-    active_matches_df = matches_df[matches_df['status'].isin(['scheduled', 'ongoing'])]
-    unavailable_players = list(set(pd.concat([active_matches_df['male_player1'], active_matches_df['female_player1'], active_matches_df['male_player2'], active_matches_df['female_player2']]).tolist())) if not active_matches_df.empty else []
-    today_attendance = attendance_df[attendance_df['date'] == today_str]
-    present_players_usernames = today_attendance.iloc[0]['present_players'].split(',') if not today_attendance.empty and pd.notna(today_attendance.iloc[0]['present_players']) else players_df['username'].tolist()
-    available_usernames = [p for p in present_players_usernames if p not in unavailable_players]
-    available_players_df = players_df[players_df['username'].isin(available_usernames)]
-    male_players, female_players = available_players_df[available_players_df['gender'] == 'Male'][['username', 'name']].to_dict('records'), available_players_df[available_players_df['gender'] == 'Female'][['username', 'name']].to_dict('records')
-    game_number = len(matches_df[matches_df['date'] == today_str]) + 1
-    if request.method == 'POST':
-        male_player1, female_player1, male_player2, female_player2, date_val, game_type = (request.form.get(k) for k in ['male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type'])
-        manually_picked = {p for p in [male_player1, female_player1, male_player2, female_player2] if p}
-        females_for_random_pool = [p['username'] for p in female_players if p['username'] not in manually_picked]
-        if 'randomize1' in request.form:
-            if not females_for_random_pool: flash('Not enough unique female players for random assignment.', 'error'); return redirect(url_for('create_match'))
-            female_player1 = random.choice(females_for_random_pool); females_for_random_pool.remove(female_player1)
-        if 'randomize2' in request.form:
-            if not females_for_random_pool: flash('Not enough unique female players for random assignment.', 'error'); return redirect(url_for('create_match'))
-            female_player2 = random.choice(females_for_random_pool)
-        all_players = [male_player1, female_player1, male_player2, female_player2]
-        if None in all_players or "" in all_players: flash('All four player slots must be filled.', 'error'); return redirect(url_for('create_match'))
-        if len(set(all_players)) < 4: flash('All four players must be unique. A player may have been auto-selected.', 'error'); return redirect(url_for('create_match'))
-        try:
-            insert_query = f"""
-                INSERT INTO `{MATCHES_TABLE_ID}` (male_player1, female_player1, male_player2, female_player2, date, game_type, status)
-                VALUES('{male_player1}', '{female_player1}', '{male_player2}', '{female_player2}', '{date_val}', '{game_type}', 'scheduled')
-            """
-            client.query(insert_query).result()
-            flash('Mixed Doubles Match created successfully!', 'success')
-        except Exception as e:
-            flash(f'Error saving match: {e}', 'error')
-        return redirect(url_for('admin_dashboard'))
-    return render_template('create_match.html', male_players=male_players, female_players=female_players, game_number=game_number, today_str=today_str)
-
-@app.route('/admin/create_custom_match', methods=['GET', 'POST'])
-def create_custom_match():
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    players_df, matches_df, attendance_df = get_all_players(), get_all_matches(), get_all_attendance()
-    today_str = date.today().strftime('%Y-%m-%d')
-    active_matches_df = matches_df[matches_df['status'].isin(['scheduled', 'ongoing'])]
-    unavailable_players = list(set(pd.concat([active_matches_df['male_player1'], active_matches_df['female_player1'], active_matches_df['male_player2'], active_matches_df['female_player2']]).tolist())) if not active_matches_df.empty else []
-    today_attendance = attendance_df[attendance_df['date'] == today_str]
-    present_players_usernames = today_attendance.iloc[0]['present_players'].split(',') if not today_attendance.empty and pd.notna(today_attendance.iloc[0]['present_players']) else players_df['username'].tolist()
-    available_usernames = [p for p in present_players_usernames if p not in unavailable_players]
-    available_players = players_df[players_df['username'].isin(available_usernames)][['username', 'name']].to_dict('records')
-    if request.method == 'POST':
-        t1_p1, t1_p2, t2_p1, t2_p2, date_val, game_type = (request.form.get(k) for k in ['team1_player1', 'team1_player2', 'team2_player1', 'team2_player2', 'date', 'game_type'])
-        all_players = [t1_p1, t1_p2, t2_p1, t2_p2]
-        if None in all_players or "" in all_players: flash('All four player slots must be filled.', 'error'); return redirect(url_for('create_custom_match'))
-        if len(set(all_players)) < 4: flash('All four players in a match must be unique.', 'error'); return redirect(url_for('create_custom_match'))
-        try:
-            insert_query = f"""
-                INSERT INTO `{MATCHES_TABLE_ID}` (male_player1, female_player1, male_player2, female_player2, date, game_type, status)
-                VALUES('{t1_p1}', '{t1_p2}', '{t2_p1}', '{t2_p2}', '{date_val}', '{game_type}', 'scheduled')
-            """
-            client.query(insert_query).result()
-            flash('Custom Match created successfully!', 'success')
-        except Exception as e:
-            flash(f'Error saving match: {e}', 'error')
-        return redirect(url_for('admin_dashboard'))
-    return render_template('create_custom_match.html', available_players=available_players, today_str=today_str)
-
-@app.route('/admin/start_match/<int:match_index>')
-def start_match(match_index):
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    matches_df = get_all_matches()
-    manageable_matches = matches_df[matches_df['status'] != 'completed'].reset_index(drop=True)
-    if match_index < len(manageable_matches):
-        match_to_update = manageable_matches.iloc[match_index]
-        query = f"""
-            UPDATE `{MATCHES_TABLE_ID}`
-            SET status = 'ongoing'
-            WHERE date = '{match_to_update['date']}' AND game_type = '{match_to_update['game_type']}'
-            AND male_player1 = '{match_to_update['male_player1']}' AND female_player1 = '{match_to_update['female_player1']}'
-            AND male_player2 = '{match_to_update['male_player2']}' AND female_player2 = '{match_to_update['female_player2']}'
-            AND status = 'scheduled'
-        """
-        try:
-            client.query(query).result(); flash('Match started!', 'success')
-        except Exception as e:
-            flash(f"Could not start match. BigQuery error: {e}", 'error')
-    else: flash('Invalid match index.', 'error')
-    return redirect(url_for('admin_dashboard'))
-
-@app.route('/admin/cancel_match/<int:match_index>')
-def cancel_match(match_index):
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    matches_df = get_all_matches()
-    manageable_matches = matches_df[matches_df['status'] != 'completed'].reset_index(drop=True)
-    if match_index < len(manageable_matches) and manageable_matches.iloc[match_index]['status'] == 'scheduled':
-        match_to_delete = manageable_matches.iloc[match_index]
-        query = f"""
-            DELETE FROM `{MATCHES_TABLE_ID}`
-            WHERE date = '{match_to_delete['date']}' AND game_type = '{match_to_delete['game_type']}'
-            AND male_player1 = '{match_to_delete['male_player1']}' AND female_player1 = '{match_to_delete['female_player1']}'
-            AND male_player2 = '{match_to_delete['male_player2']}' AND female_player2 = '{match_to_delete['female_player2']}'
-            AND status = 'scheduled'
-        """
-        try:
-            client.query(query).result(); flash('Scheduled match has been successfully canceled.', 'success')
-        except Exception as e:
-            flash(f"Could not cancel match. BigQuery error: {e}", 'error')
-    else:
-        flash('Could not cancel match. It might already be ongoing or completed.', 'error')
-    return redirect(url_for('admin_dashboard'))
-
-@app.route('/admin/finish_match', methods=['POST'])
-def finish_match():
-    if session.get('role') != 'admin': return redirect(url_for('login'))
-    matches_df = get_all_matches()
-    manageable_matches = matches_df[matches_df['status'] != 'completed'].reset_index(drop=True)
-    match_index, winner_team, score = int(request.form['match_index']), request.form['winner_team'], request.form['score']
-    remark = generate_remark(score)
-    if match_index < len(manageable_matches):
-        match_to_update = manageable_matches.iloc[match_index]
-        update_query = f"""
-            UPDATE `{MATCHES_TABLE_ID}`
-            SET status = 'completed', winner_team = '{winner_team}', score = '{score}', remark = '{remark}'
-            WHERE date = '{match_to_update['date']}' AND game_type = '{match_to_update['game_type']}'
-            AND male_player1 = '{match_to_update['male_player1']}' AND female_player1 = '{match_to_update['female_player1']}'
-            AND male_player2 = '{match_to_update['male_player2']}' AND female_player2 = '{match_to_update['female_player2']}'
-            AND status = 'ongoing'
-        """
-        client.query(update_query).result()
-        winners, losers = ([match_to_update['male_player1'], match_to_update['female_player1']], [match_to_update['male_player2'], match_to_update['female_player2']]) if winner_team == 'Team 1' else ([match_to_update['male_player2'], match_to_update['female_player2']], [match_to_update['male_player1'], match_to_update['female_player1']])
-        for player_list, result_col in [(winners, 'wins'), (losers, 'losses')]:
-            for username in player_list:
-                if username:
-                    update_player_query = f"""
-                        UPDATE `{PLAYERS_TABLE_ID}`
-                        SET {result_col} = {result_col} + 1
-                        WHERE username = '{username}'
-                    """
-                    client.query(update_player_query).result()
-        flash('Match finished and results recorded.', 'success')
-    else: flash('Failed to record results. Invalid match index.', 'error')
-    return redirect(url_for('admin_dashboard'))
-
-# --- Main Execution Block ---
-if __name__ == '__main__':
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(USERS_FILE):
-        pd.DataFrame(columns=['username', 'password', 'role']).to_csv(USERS_FILE, index=False)
-    
-    users_df = read_csv(USERS_FILE)
-    if 'admin' not in users_df['username'].values:
-        hashed_password = generate_password_hash('adminpass')
-        admin_user = pd.DataFrame([['admin', hashed_password, 'admin']], columns=['username', 'password', 'role'])
-        write_csv(pd.concat([users_df, admin_user], ignore_index=True), USERS_FILE)
-
-    app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
+import csv
+import os
+import numpy as np
+import pandas as pd
+import requests.adapters
+import random
+import re
+import uuid
+from datetime import date
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
+from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask_caching import Cache
+from werkzeug.security import generate_password_hash, check_password_hash
+from google.cloud import bigquery
+from google.api_core.exceptions import NotFound
+
+# --- BigQuery Configuration ---
+try:
+    client = bigquery.Client()
+    PROJECT_ID = client.project
+    DATASET_ID = "smashers_data"
+    # Widen the client's HTTP connection pool (default is 10) so threaded
+    # servers (gunicorn --threads) don't serialize concurrent BigQuery calls.
+    # Workers must be threads, not forks: an authenticated session must not be
+    # shared across a fork.
+    try:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=32, pool_maxsize=32)
+        client._http.mount('https://', adapter)
+    except Exception:
+        pass
+except Exception as e:
+    print("ERROR: Could not initialize BigQuery client.")
+    print("Please ensure GOOGLE_APPLICATION_CREDENTIALS environment variable is set correctly.")
+    client = None
+
+# Optional BigQuery Storage API client: downloads results as Arrow over gRPC,
+# which is much faster than the default REST/JSON path for larger tables.
+try:
+    from google.cloud import bigquery_storage
+    bqstorage_client = bigquery_storage.BigQueryReadClient()
+except Exception:
+    bqstorage_client = None
+
+# Define table IDs
+PLAYERS_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.players"
+# Match rows are addressed by a UUID primary key; add the column once with:
+#   ALTER TABLE `<project>.smashers_data.matches` ADD COLUMN match_id STRING
+# Date/status filters prune storage if the table is rebuilt partitioned and
+# clustered (requires migrating `date` from STRING to DATE):
+#   CREATE TABLE `...matches_v2` PARTITION BY date CLUSTER BY status AS
+#   SELECT * REPLACE (PARSE_DATE('%Y-%m-%d', date) AS date) FROM `...matches`
+MATCHES_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.matches"
+ATTENDANCE_TABLE_ID = f"{PROJECT_ID}.{DATASET_ID}.attendance"
+# Incrementally maintained by BigQuery as wins/losses change; create once with:
+#   CREATE MATERIALIZED VIEW `<project>.smashers_data.mv_player_rankings` AS
+#   SELECT username, name, age, gender, wins, losses,
+#          IFNULL(SAFE_DIVIDE(wins, NULLIF(wins + losses, 0)), 0) AS win_loss_ratio
+#   FROM `<project>.smashers_data.players`
+RANKINGS_MV_ID = f"{PROJECT_ID}.{DATASET_ID}.mv_player_rankings"
+
+app = Flask(__name__, template_folder='templates', static_folder='../static')
+app.secret_key = 'a_very_secret_and_secure_key_for_dev_v20_final'
+# Short-TTL cache over the BigQuery table reads; write paths invalidate the
+# tables they touch so admins see their own changes immediately.
+cache = Cache(app, config={'CACHE_TYPE': 'SimpleCache', 'CACHE_DEFAULT_TIMEOUT': 60})
+
+# --- Helper Functions ---
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+USERS_FILE = os.path.join(DATA_DIR, 'users.csv')
+
+# CSV reads are memoized on file mtime so warm requests skip re-parsing;
+# append_csv_row drops the entry so the next read reloads the file.
+_csv_cache = {}
+
+def read_csv(file_path):
+    if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+        return pd.DataFrame(columns=['username', 'password', 'role'])
+    mtime = os.stat(file_path).st_mtime
+    cached = _csv_cache.get(file_path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    df = pd.read_csv(file_path)
+    _csv_cache[file_path] = (mtime, df)
+    return df
+
+def append_csv_row(file_path, row):
+    # O(1) append for a single new row; the next read_csv reloads via mtime.
+    with open(file_path, 'a', newline='') as f:
+        csv.writer(f).writerow(row)
+    _csv_cache.pop(file_path, None)
+
+# username -> (password_hash, role), rebuilt only when users.csv changes, so
+# login is a dict lookup instead of a DataFrame scan.
+_users_index_cache = {'mtime': None, 'index': {}}
+
+def get_users_index():
+    mtime = os.stat(USERS_FILE).st_mtime if os.path.exists(USERS_FILE) else None
+    if _users_index_cache['mtime'] != mtime:
+        users_df = read_csv(USERS_FILE)
+        _users_index_cache['index'] = dict(zip(users_df['username'], zip(users_df['password'], users_df['role'])))
+        _users_index_cache['mtime'] = mtime
+    return _users_index_cache['index']
+
+_DIGITS_RE = re.compile(r'\d+')
+_SCORE_PAIR_RE = re.compile(r'(\d+)\D*(\d+)?')
+_REMARKS = ("Nice Close Game!", "Well Fought Match!", "Decisive Victory!")
+
+@lru_cache(maxsize=1024)
+def generate_remark(score):
+    if not score or not isinstance(score, str): return ""
+    try:
+        games = [int(g) for g in _DIGITS_RE.findall(score)]
+        if len(games) < 2 or len(games) % 2 != 0: return ""
+        difference = abs(sum(games[::2]) - sum(games[1::2]))
+        return _REMARKS[(difference > 2) + (difference > 5)]
+    except (ValueError, TypeError): return ""
+
+# Safety cap on per-query scan volume; generous next to these table sizes.
+_MAX_BYTES_BILLED = 10 ** 9
+
+def query_bq(sql, params=None):
+    # use_query_cache is explicit so repeated identical statements (same text
+    # and parameter values) are served from BigQuery's 24h result cache.
+    job_config = bigquery.QueryJobConfig(
+        query_parameters=params or [],
+        use_query_cache=True,
+        maximum_bytes_billed=_MAX_BYTES_BILLED)
+    return client.query(sql, job_config=job_config)
+
+def job_to_dataframe(query_job):
+    # Falls back to the REST download path when the Storage API is unavailable.
+    return query_job.to_dataframe(bqstorage_client=bqstorage_client)
+
+def execute_dml(sql, params=None):
+    return query_bq(sql, params).result()
+
+# Background lane for writes whose outcome the admin doesn't need to wait on.
+# Failures are queued and surfaced as flash messages on the next admin page.
+_bq_executor = ThreadPoolExecutor(max_workers=4)
+_bg_errors = []
+
+def submit_dml_async(sql, params=None):
+    def _run():
+        try:
+            execute_dml(sql, params)
+        except Exception as e:
+            _bg_errors.append(str(e))
+    _bq_executor.submit(_run)
+
+def read_table(table_id, columns, categorical=()):
+    # Low-cardinality string columns are cast to category so later equality
+    # filters compare integer codes instead of Python string objects.
+    try:
+        df = job_to_dataframe(query_bq(f"SELECT * FROM `{table_id}`"))
+        for col in categorical:
+            if col in df.columns:
+                df[col] = df[col].astype('category')
+        return df
+    except (NotFound, Exception):
+        return pd.DataFrame(columns=columns)
+
+# Longer TTL than the other tables: players only change on register and
+# finish_match, and both of those delete this entry, so the TTL is just a
+# backstop rather than the freshness mechanism.
+@cache.memoize(300)
+def get_all_players():
+    return read_table(PLAYERS_TABLE_ID, ['username', 'name', 'age', 'gender', 'wins', 'losses'], categorical=('gender',))
+
+# Process-level cache of the username -> first-name mapping, kept as a Series
+# indexed by username: every consumer is a Series.map call, and mapping with a
+# Series reuses its hash index instead of rebuilding one from a dict per call.
+# The mapping only changes when a player is added, so routes reuse it across
+# requests until a write path bumps the version.
+_first_names_cache = {'version': 0, 'built_version': -1, 'map': pd.Series(dtype=object)}
+
+def invalidate_first_names():
+    _first_names_cache['version'] += 1
+
+def get_first_name_map():
+    if _first_names_cache['built_version'] != _first_names_cache['version']:
+        # The split happens in SQL, so only the two columns the map needs
+        # cross the wire, already computed.
+        try:
+            sql = f"SELECT username, SPLIT(name, ' ')[OFFSET(0)] AS first_name FROM `{PLAYERS_TABLE_ID}`"
+            fn_df = job_to_dataframe(query_bq(sql))
+            _first_names_cache['map'] = pd.Series(fn_df['first_name'].to_numpy(), index=fn_df['username'])
+        except (NotFound, Exception):
+            _first_names_cache['map'] = pd.Series(dtype=object)
+        _first_names_cache['built_version'] = _first_names_cache['version']
+    return _first_names_cache['map']
+
+def get_player_matches(username, status=None):
+    # Filter to the player's matches and resolve all four first names inside
+    # BigQuery, so only the relevant rows cross the wire, already annotated.
+    try:
+        sql = f"""
+            WITH p AS (SELECT username, SPLIT(name, ' ')[OFFSET(0)] AS fn FROM `{PLAYERS_TABLE_ID}`)
+            SELECT m.*, p1.fn AS p1_fn, p2.fn AS p2_fn, p3.fn AS p3_fn, p4.fn AS p4_fn
+            FROM `{MATCHES_TABLE_ID}` m
+            LEFT JOIN p p1 ON p1.username = m.male_player1
+            LEFT JOIN p p2 ON p2.username = m.female_player1
+            LEFT JOIN p p3 ON p3.username = m.male_player2
+            LEFT JOIN p p4 ON p4.username = m.female_player2
+            WHERE @u IN (m.male_player1, m.female_player1, m.male_player2, m.female_player2)
+        """
+        params = [bigquery.ScalarQueryParameter('u', 'STRING', username)]
+        if status:
+            sql += " AND m.status = @s"
+            params.append(bigquery.ScalarQueryParameter('s', 'STRING', status))
+        return job_to_dataframe(query_bq(sql, params))
+    except (NotFound, Exception):
+        return pd.DataFrame(columns=['match_id', 'male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type', 'status', 'winner_team', 'score', 'remark', 'p1_fn', 'p2_fn', 'p3_fn', 'p4_fn'])
+
+def get_completed_matches(start_date=None, end_date=None):
+    try:
+        sql = f"SELECT * FROM `{MATCHES_TABLE_ID}` WHERE status = 'completed'"
+        params = []
+        if start_date and end_date:
+            sql += " AND date BETWEEN @s AND @e"
+            params = [bigquery.ScalarQueryParameter('s', 'STRING', start_date),
+                      bigquery.ScalarQueryParameter('e', 'STRING', end_date)]
+        sql += " ORDER BY date DESC"
+        return job_to_dataframe(query_bq(sql, params))
+    except (NotFound, Exception):
+        return pd.DataFrame(columns=['match_id', 'male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type', 'status', 'winner_team', 'score', 'remark'])
+
+def get_attendance_for_day(day_str):
+    try:
+        sql = f"SELECT * FROM `{ATTENDANCE_TABLE_ID}` WHERE date = @d LIMIT 1"
+        rows = list(query_bq(sql, [bigquery.ScalarQueryParameter('d', 'STRING', day_str)]).result())
+        return dict(rows[0]) if rows else None
+    except (NotFound, Exception):
+        return None
+
+def get_manageable_matches():
+    # Non-completed matches only, in a stable display order. Admin actions
+    # address rows by match_id, so this is only ever used for rendering.
+    try:
+        sql = f"""
+            SELECT * FROM `{MATCHES_TABLE_ID}`
+            WHERE status != 'completed'
+            ORDER BY date, game_type, male_player1, female_player1, male_player2, female_player2
+        """
+        return job_to_dataframe(query_bq(sql))
+    except (NotFound, Exception):
+        return pd.DataFrame(columns=['match_id', 'male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type', 'status', 'winner_team', 'score', 'remark'])
+
+def get_available_players_df(today_str):
+    # Players who are marked present today (or everyone, if attendance wasn't
+    # taken) and are not already in a scheduled/ongoing match. Shared by both
+    # match-creation routes. One query instead of separate players, matches
+    # and attendance fetches joined client-side.
+    try:
+        sql = f"""
+            WITH att AS (
+                SELECT present_players FROM `{ATTENDANCE_TABLE_ID}`
+                WHERE date = @d AND present_players IS NOT NULL LIMIT 1
+            ),
+            present AS (
+                SELECT u AS username FROM att, UNNEST(SPLIT(present_players, ',')) AS u
+            ),
+            active AS (
+                SELECT DISTINCT u AS username
+                FROM `{MATCHES_TABLE_ID}` m,
+                UNNEST([m.male_player1, m.female_player1, m.male_player2, m.female_player2]) AS u
+                WHERE m.status IN ('scheduled', 'ongoing') AND u IS NOT NULL
+            )
+            SELECT p.* FROM `{PLAYERS_TABLE_ID}` p
+            WHERE NOT EXISTS (SELECT 1 FROM active a WHERE a.username = p.username)
+            AND (NOT EXISTS (SELECT 1 FROM att)
+                 OR EXISTS (SELECT 1 FROM present pr WHERE pr.username = p.username))
+        """
+        return job_to_dataframe(query_bq(sql, [bigquery.ScalarQueryParameter('d', 'STRING', today_str)]))
+    except (NotFound, Exception):
+        return pd.DataFrame(columns=['username', 'name', 'age', 'gender', 'wins', 'losses'])
+
+def count_matches_for_day(day_str):
+    # Single-integer aggregate; feeds the "Game N" label on match creation.
+    try:
+        sql = f"SELECT COUNT(*) AS n FROM `{MATCHES_TABLE_ID}` WHERE date = @d"
+        rows = list(query_bq(sql, [bigquery.ScalarQueryParameter('d', 'STRING', day_str)]).result())
+        return rows[0]['n'] if rows else 0
+    except (NotFound, Exception):
+        return 0
+
+def get_matches_for_day(day_str, status):
+    try:
+        sql = f"SELECT * FROM `{MATCHES_TABLE_ID}` WHERE date = @d AND status = @s"
+        return job_to_dataframe(query_bq(sql, [
+            bigquery.ScalarQueryParameter('d', 'STRING', day_str),
+            bigquery.ScalarQueryParameter('s', 'STRING', status)]))
+    except (NotFound, Exception):
+        return pd.DataFrame(columns=['match_id', 'male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type', 'status', 'winner_team', 'score', 'remark'])
+
+def get_match(match_id):
+    # Single-row point lookup; returns a plain dict or None.
+    try:
+        sql = f"SELECT * FROM `{MATCHES_TABLE_ID}` WHERE match_id = @id LIMIT 1"
+        rows = list(query_bq(sql, [bigquery.ScalarQueryParameter('id', 'STRING', match_id)]).result())
+        return dict(rows[0]) if rows else None
+    except (NotFound, Exception):
+        return None
+
+def get_player(username):
+    # Single-row point lookup; returns a plain dict or None.
+    try:
+        sql = f"SELECT * FROM `{PLAYERS_TABLE_ID}` WHERE username = @u LIMIT 1"
+        rows = list(query_bq(sql, [bigquery.ScalarQueryParameter('u', 'STRING', username)]).result())
+        return dict(rows[0]) if rows else None
+    except (NotFound, Exception):
+        return None
+
+def player_exists(username):
+    try:
+        sql = f"SELECT 1 FROM `{PLAYERS_TABLE_ID}` WHERE username = @u LIMIT 1"
+        return query_bq(sql, [bigquery.ScalarQueryParameter('u', 'STRING', username)]).result().total_rows > 0
+    except (NotFound, Exception):
+        return False
+
+
+def login_required(role=None):
+    # Authorization reads only the signed session cookie; no route should hit
+    # the user store just to re-check who is logged in.
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if 'username' not in session or (role and session.get('role') != role):
+                return redirect(url_for('login'))
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
+
+
+@app.route('/')
+def index(): return render_template('index.html')
+
+@app.route('/register', methods=['GET', 'POST'])
+def register():
+    if request.method == 'POST':
+        username, password, name, age, gender = request.form['username'], request.form['password'], request.form['name'], request.form['age'], request.form['gender']
+        if username in get_users_index() or player_exists(username):
+            flash('Username already exists!', 'error'); return redirect(url_for('register'))
+        hashed_password = generate_password_hash(password, method='pbkdf2:sha256', salt_length=16)
+        append_csv_row(USERS_FILE, [username, hashed_password, 'player'])
+        insert_sql = f"""
+            INSERT INTO `{PLAYERS_TABLE_ID}` (username, name, age, gender, wins, losses)
+            VALUES(@username, @name, @age, @gender, 0, 0)
+        """
+        try:
+            execute_dml(insert_sql, [
+                bigquery.ScalarQueryParameter('username', 'STRING', username),
+                bigquery.ScalarQueryParameter('name', 'STRING', name),
+                bigquery.ScalarQueryParameter('age', 'INT64', int(age)),
+                bigquery.ScalarQueryParameter('gender', 'STRING', gender)])
+        except Exception as e:
+            flash(f'Error saving player data: {e}', 'error'); return redirect(url_for('register'))
+        cache.delete_memoized(get_all_players)
+        invalidate_first_names()
+        flash('Registration successful! Please log in.', 'success'); return redirect(url_for('login'))
+    return render_template('register.html')
+
+@app.route('/login', methods=['GET', 'POST'])
+def login():
+    if request.method == 'POST':
+        username, password = request.form['username'], request.form['password']
+        hashed_password, role = get_users_index().get(username, (None, None))
+        if hashed_password and check_password_hash(hashed_password, password):
+            session['username'], session['role'] = username, role
+            return redirect(url_for('admin_dashboard' if session['role'] == 'admin' else 'dashboard'))
+        flash('Invalid username or password.', 'error'); return redirect(url_for('login'))
+    return render_template('login.html')
+
+@app.route('/logout')
+def logout():
+    session.clear(); flash('You have been logged out.', 'success'); return redirect(url_for('login'))
+
+@app.route('/dashboard')
+@login_required(role='player')
+def dashboard():
+    username = session['username']
+    player_data = get_player(username)
+    if player_data is None:
+        flash('Player not found.', 'error'); return redirect(url_for('login'))
+    player_matches_df = get_player_matches(username)
+    if player_matches_df.empty:
+        processed_matches = []
+    else:
+        m = player_matches_df
+        is_team1 = m['male_player1'].eq(username) | m['female_player1'].eq(username)
+        partner_name = pd.Series(np.where(is_team1, np.where(m['male_player1'].eq(username), m['p2_fn'], m['p1_fn']), np.where(m['male_player2'].eq(username), m['p4_fn'], m['p3_fn'])), index=m.index).fillna('')
+        opp_male = pd.Series(np.where(is_team1, m['p3_fn'], m['p1_fn']), index=m.index).fillna(pd.Series(np.where(is_team1, m['male_player2'], m['male_player1']), index=m.index))
+        opp_female = pd.Series(np.where(is_team1, m['p4_fn'], m['p2_fn']), index=m.index).fillna(pd.Series(np.where(is_team1, m['female_player2'], m['female_player1']), index=m.index))
+        processed_matches = m.assign(
+            partner_name=partner_name,
+            opponents_names=opp_male + ' & ' + opp_female
+        ).to_dict('records')
+    return render_template('dashboard.html', player=player_data, matches=processed_matches)
+
+@app.route('/rankings')
+def rankings():
+    # Prefer the materialized view (pre-computed, refreshed incrementally on
+    # player updates); fall back to computing the ratio inline if it hasn't
+    # been created in this project yet.
+    try:
+        sql = f"SELECT * FROM `{RANKINGS_MV_ID}` ORDER BY win_loss_ratio DESC"
+        ranked_players = [dict(row) for row in query_bq(sql).result()]
+    except Exception:
+        try:
+            sql = f"""
+                SELECT username, name, age, gender, wins, losses,
+                       IFNULL(SAFE_DIVIDE(wins, NULLIF(wins + losses, 0)), 0) AS win_loss_ratio
+                FROM `{PLAYERS_TABLE_ID}`
+                ORDER BY win_loss_ratio DESC
+            """
+            ranked_players = [dict(row) for row in query_bq(sql).result()]
+        except (NotFound, Exception):
+            ranked_players = []
+    return render_template('rankings.html', players=ranked_players)
+
+@app.route('/player/<username>')
+def player_profile(username):
+    player_data = get_player(username)
+    if player_data is None: flash('Player not found.', 'error'); return redirect(url_for('rankings'))
+    completed_matches_df = get_player_matches(username, status='completed')
+    if completed_matches_df.empty:
+        processed_matches = []
+    else:
+        m = completed_matches_df
+        is_team1 = m['male_player1'].eq(username) | m['female_player1'].eq(username)
+        partner_name = pd.Series(np.where(is_team1, np.where(m['male_player1'].eq(username), m['p2_fn'], m['p1_fn']), np.where(m['male_player2'].eq(username), m['p4_fn'], m['p3_fn'])), index=m.index).fillna('')
+        opp_male = pd.Series(np.where(is_team1, m['p3_fn'], m['p1_fn']), index=m.index).fillna(pd.Series(np.where(is_team1, m['male_player2'], m['male_player1']), index=m.index))
+        opp_female = pd.Series(np.where(is_team1, m['p4_fn'], m['p2_fn']), index=m.index).fillna(pd.Series(np.where(is_team1, m['female_player2'], m['female_player1']), index=m.index))
+        processed_matches = m.assign(
+            partner_name=partner_name,
+            opponents_names=opp_male + ' & ' + opp_female
+        ).to_dict('records')
+    return render_template('player_profile.html', player=player_data, matches=processed_matches)
+
+@app.route('/ongoing_matches')
+def ongoing_matches():
+    player_first_names = get_first_name_map()
+    today_str = date.today().strftime('%Y-%m-%d')
+    todays_ongoing_df = get_matches_for_day(today_str, 'ongoing')
+    todays_ongoing_list = todays_ongoing_df.assign(
+        t1_p1_name=todays_ongoing_df['male_player1'].map(player_first_names).fillna(todays_ongoing_df['male_player1']),
+        t1_p2_name=todays_ongoing_df['female_player1'].map(player_first_names).fillna(todays_ongoing_df['female_player1']),
+        t2_p1_name=todays_ongoing_df['male_player2'].map(player_first_names).fillna(todays_ongoing_df['male_player2']),
+        t2_p2_name=todays_ongoing_df['female_player2'].map(player_first_names).fillna(todays_ongoing_df['female_player2'])
+    ).to_dict('records')
+    return render_template('ongoing_matches.html', matches=todays_ongoing_list)
+
+@app.route('/history', methods=['GET', 'POST'])
+def history():
+    player_first_names = get_first_name_map()
+    start_date, end_date = request.form.get('start_date'), request.form.get('end_date')
+    # Status and date-range filters run in BigQuery (already sorted newest
+    # first), so only the rows the page shows are downloaded.
+    completed_matches = get_completed_matches(start_date, end_date)
+    grouped_matches = OrderedDict()
+    if not completed_matches.empty:
+        cm = completed_matches
+        t1_p1 = cm['male_player1'].map(player_first_names).fillna(cm['male_player1'])
+        t1_p2 = cm['female_player1'].map(player_first_names).fillna(cm['female_player1'])
+        t2_p1 = cm['male_player2'].map(player_first_names).fillna(cm['male_player2'])
+        t2_p2 = cm['female_player2'].map(player_first_names).fillna(cm['female_player2'])
+        # First two numbers in the score string; a lone number pairs with 0,
+        # no numbers at all parses as 0-0 (mirrors the old per-row fallback).
+        scores = cm['score'].fillna('').astype(str).str.extract(_SCORE_PAIR_RE).fillna(0).astype(int)
+        team1_won = cm['winner_team'].eq('Team 1').to_numpy()
+        formatted_dates = pd.to_datetime(cm['date'], format='%Y-%m-%d', cache=True).dt.strftime('%B %d, %Y (%A)')
+        cm = cm.assign(
+            winner_p1_name=np.where(team1_won, t1_p1, t2_p1),
+            winner_p2_name=np.where(team1_won, t1_p2, t2_p2),
+            loser_p1_name=np.where(team1_won, t2_p1, t1_p1),
+            loser_p2_name=np.where(team1_won, t2_p2, t1_p2),
+            winner_score=scores.max(axis=1),
+            loser_score=scores.min(axis=1),
+            _formatted_date=formatted_dates)
+        # Rows are already sorted by date descending; sort=False keeps that
+        # order, so the groups render newest-first like the old loop did.
+        for formatted_date, day_df in cm.groupby('_formatted_date', sort=False):
+            grouped_matches[formatted_date] = day_df.drop(columns='_formatted_date').to_dict('records')
+    return render_template('history.html', grouped_matches=grouped_matches, start_date=start_date, end_date=end_date)
+
+@app.route('/admin')
+@login_required(role='admin')
+def admin_dashboard():
+    while _bg_errors:
+        flash(f"A background update failed: {_bg_errors.pop(0)}", 'error')
+    player_first_names = get_first_name_map()
+    display_matches_df = get_manageable_matches()
+    title = "Manage Upcoming & Ongoing Matches"
+    display_matches_list = display_matches_df.assign(
+        t1_p1_name=display_matches_df['male_player1'].map(player_first_names).fillna(display_matches_df['male_player1']),
+        t1_p2_name=display_matches_df['female_player1'].map(player_first_names).fillna(display_matches_df['female_player1']),
+        t2_p1_name=display_matches_df['male_player2'].map(player_first_names).fillna(display_matches_df['male_player2']),
+        t2_p2_name=display_matches_df['female_player2'].map(player_first_names).fillna(display_matches_df['female_player2'])
+    ).to_dict('records')
+    return render_template('admin_dashboard.html', matches=display_matches_list, title=title)
+
+@app.route('/admin/attendance', methods=['GET', 'POST'])
+@login_required(role='admin')
+def attendance():
+    today_str = date.today().strftime('%Y-%m-%d')
+    players_df = get_all_players()
+    if request.method == 'POST':
+        present_players = request.form.getlist('present_players')
+        present_players_str = ','.join(present_players)
+        try:
+            # One atomic upsert instead of a SELECT-then-UPDATE-or-INSERT
+            # sequence: single BigQuery job, and no window where today's row
+            # is missing while two admins save at once.
+            merge_sql = f"""
+                MERGE `{ATTENDANCE_TABLE_ID}` T
+                USING (SELECT @d AS date, @p AS present_players) S
+                ON T.date = S.date
+                WHEN MATCHED THEN UPDATE SET present_players = S.present_players
+                WHEN NOT MATCHED THEN INSERT (date, present_players) VALUES (S.date, S.present_players)
+            """
+            execute_dml(merge_sql, [
+                bigquery.ScalarQueryParameter('d', 'STRING', today_str),
+                bigquery.ScalarQueryParameter('p', 'STRING', present_players_str)])
+            flash('Attendance for today has been saved!', 'success')
+        except Exception as e:
+            flash(f"An error occurred: {e}", "error")
+        return redirect(url_for('admin_dashboard'))
+    male_players, female_players = players_df[players_df['gender'] == 'Male'].to_dict('records'), players_df[players_df['gender'] == 'Female'].to_dict('records')
+    today_record = get_attendance_for_day(today_str)
+    present_today = today_record['present_players'].split(',') if today_record and pd.notna(today_record.get('present_players')) else []
+    return render_template('attendance.html', male_players=male_players, female_players=female_players, present_today=present_today)
+
+@app.route('/admin/create_match', methods=['GET', 'POST'])
+@login_required(role='admin')
+def create_match():
+    today_str = date.today().strftime('%Y-%m-%d')
+    available_players_df = get_available_players_df(today_str)
+    male_players, female_players = available_players_df[available_players_df['gender'] == 'Male'][['username', 'name']].to_dict('records'), available_players_df[available_players_df['gender'] == 'Female'][['username', 'name']].to_dict('records')
+    game_number = count_matches_for_day(today_str) + 1
+    if request.method == 'POST':
+        male_player1, female_player1, male_player2, female_player2, date_val, game_type = (request.form.get(k) for k in ['male_player1', 'female_player1', 'male_player2', 'female_player2', 'date', 'game_type'])
+        manually_picked = {p for p in [male_player1, female_player1, male_player2, female_player2] if p}
+        females_for_random_pool = [p['username'] for p in female_players if p['username'] not in manually_picked]
+        if 'randomize1' in request.form:
+            if not females_for_random_pool: flash('Not enough unique female players for random assignment.', 'error'); return redirect(url_for('create_match'))
+            female_player1 = random.choice(females_for_random_pool); females_for_random_pool.remove(female_player1)
+        if 'randomize2' in request.form:
+            if not females_for_random_pool: flash('Not enough unique female players for random assignment.', 'error'); return redirect(url_for('create_match'))
+            female_player2 = random.choice(females_for_random_pool)
+        all_players = [male_player1, female_player1, male_player2, female_player2]
+        if None in all_players or "" in all_players: flash('All four player slots must be filled.', 'error'); return redirect(url_for('create_match'))
+        if len(set(all_players)) < 4: flash('All four players must be unique. A player may have been auto-selected.', 'error'); return redirect(url_for('create_match'))
+        try:
+            insert_query = f"""
+                INSERT INTO `{MATCHES_TABLE_ID}` (match_id, male_player1, female_player1, male_player2, female_player2, date, game_type, status)
+                VALUES(@id, @mp1, @fp1, @mp2, @fp2, @date, @game_type, 'scheduled')
+            """
+            execute_dml(insert_query, [
+                bigquery.ScalarQueryParameter('id', 'STRING', uuid.uuid4().hex),
+                bigquery.ScalarQueryParameter('mp1', 'STRING', male_player1),
+                bigquery.ScalarQueryParameter('fp1', 'STRING', female_player1),
+                bigquery.ScalarQueryParameter('mp2', 'STRING', male_player2),
+                bigquery.ScalarQueryParameter('fp2', 'STRING', female_player2),
+                bigquery.ScalarQueryParameter('date', 'STRING', date_val),
+                bigquery.ScalarQueryParameter('game_type', 'STRING', game_type)])
+            flash('Mixed Doubles Match created successfully!', 'success')
+        except Exception as e:
+            flash(f'Error saving match: {e}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    return render_template('create_match.html', male_players=male_players, female_players=female_players, game_number=game_number, today_str=today_str)
+
+@app.route('/admin/create_custom_match', methods=['GET', 'POST'])
+@login_required(role='admin')
+def create_custom_match():
+    today_str = date.today().strftime('%Y-%m-%d')
+    available_players = get_available_players_df(today_str)[['username', 'name']].to_dict('records')
+    if request.method == 'POST':
+        t1_p1, t1_p2, t2_p1, t2_p2, date_val, game_type = (request.form.get(k) for k in ['team1_player1', 'team1_player2', 'team2_player1', 'team2_player2', 'date', 'game_type'])
+        all_players = [t1_p1, t1_p2, t2_p1, t2_p2]
+        if None in all_players or "" in all_players: flash('All four player slots must be filled.', 'error'); return redirect(url_for('create_custom_match'))
+        if len(set(all_players)) < 4: flash('All four players in a match must be unique.', 'error'); return redirect(url_for('create_custom_match'))
+        try:
+            insert_query = f"""
+                INSERT INTO `{MATCHES_TABLE_ID}` (match_id, male_player1, female_player1, male_player2, female_player2, date, game_type, status)
+                VALUES(@id, @mp1, @fp1, @mp2, @fp2, @date, @game_type, 'scheduled')
+            """
+            execute_dml(insert_query, [
+                bigquery.ScalarQueryParameter('id', 'STRING', uuid.uuid4().hex),
+                bigquery.ScalarQueryParameter('mp1', 'STRING', t1_p1),
+                bigquery.ScalarQueryParameter('fp1', 'STRING', t1_p2),
+                bigquery.ScalarQueryParameter('mp2', 'STRING', t2_p1),
+                bigquery.ScalarQueryParameter('fp2', 'STRING', t2_p2),
+                bigquery.ScalarQueryParameter('date', 'STRING', date_val),
+                bigquery.ScalarQueryParameter('game_type', 'STRING', game_type)])
+            flash('Custom Match created successfully!', 'success')
+        except Exception as e:
+            flash(f'Error saving match: {e}', 'error')
+        return redirect(url_for('admin_dashboard'))
+    return render_template('create_custom_match.html', available_players=available_players, today_str=today_str)
+
+@app.route('/admin/start_match/<match_id>')
+@login_required(role='admin')
+def start_match(match_id):
+    # The status guard lives in the WHERE clause, so a stale page can't start
+    # a match twice; zero affected rows means it was no longer 'scheduled'.
+    query = f"UPDATE `{MATCHES_TABLE_ID}` SET status = 'ongoing' WHERE match_id = @id AND status = 'scheduled'"
+    try:
+        job = query_bq(query, [bigquery.ScalarQueryParameter('id', 'STRING', match_id)])
+        job.result()
+        if job.num_dml_affected_rows:
+            flash('Match started!', 'success')
+        else:
+            flash('Could not start match. It might already be ongoing or completed.', 'error')
+    except Exception as e:
+        flash(f"Could not start match. BigQuery error: {e}", 'error')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/cancel_match/<match_id>')
+@login_required(role='admin')
+def cancel_match(match_id):
+    query = f"DELETE FROM `{MATCHES_TABLE_ID}` WHERE match_id = @id AND status = 'scheduled'"
+    try:
+        job = query_bq(query, [bigquery.ScalarQueryParameter('id', 'STRING', match_id)])
+        job.result()
+        if job.num_dml_affected_rows:
+            flash('Scheduled match has been successfully canceled.', 'success')
+        else:
+            flash('Could not cancel match. It might already be ongoing or completed.', 'error')
+    except Exception as e:
+        flash(f"Could not cancel match. BigQuery error: {e}", 'error')
+    return redirect(url_for('admin_dashboard'))
+
+@app.route('/admin/finish_match', methods=['POST'])
+@login_required(role='admin')
+def finish_match():
+    match_id, winner_team, score = request.form['match_id'], request.form['winner_team'], request.form['score']
+    remark = generate_remark(score)
+    match_to_update = get_match(match_id)
+    if match_to_update and match_to_update.get('status') == 'ongoing':
+        winners, losers = ([match_to_update['male_player1'], match_to_update['female_player1']], [match_to_update['male_player2'], match_to_update['female_player2']]) if winner_team == 'Team 1' else ([match_to_update['male_player2'], match_to_update['female_player2']], [match_to_update['male_player1'], match_to_update['female_player1']])
+        # One scripted transaction: match completion plus a single UPDATE that
+        # bumps wins and losses for all four players at once. The IF EXISTS
+        # guard keys the stat bump to the match actually transitioning out of
+        # 'ongoing': the route's own status check races the background commit
+        # (the admin page can still show the finish form for a moment), so a
+        # resubmitted form must replay as a no-op rather than double-count.
+        finish_script = f"""
+            BEGIN TRANSACTION;
+            IF EXISTS (SELECT 1 FROM `{MATCHES_TABLE_ID}` WHERE match_id = @id AND status = 'ongoing') THEN
+                UPDATE `{MATCHES_TABLE_ID}`
+                SET status = 'completed', winner_team = @winner_team, score = @score, remark = @remark
+                WHERE match_id = @id AND status = 'ongoing';
+                UPDATE `{PLAYERS_TABLE_ID}`
+                SET wins = wins + IF(username IN UNNEST(@winners), 1, 0),
+                    losses = losses + IF(username IN UNNEST(@losers), 1, 0)
+                WHERE username IN UNNEST(@winners) OR username IN UNNEST(@losers);
+            END IF;
+            COMMIT TRANSACTION;
+        """
+        submit_dml_async(finish_script, [
+            bigquery.ScalarQueryParameter('winner_team', 'STRING', winner_team),
+            bigquery.ScalarQueryParameter('score', 'STRING', score),
+            bigquery.ScalarQueryParameter('remark', 'STRING', remark),
+            bigquery.ScalarQueryParameter('id', 'STRING', match_id),
+            bigquery.ArrayQueryParameter('winners', 'STRING', [u for u in winners if u]),
+            bigquery.ArrayQueryParameter('losers', 'STRING', [u for u in losers if u])])
+        cache.delete_memoized(get_all_players)
+        flash('Match finished and results recorded.', 'success')
+    else: flash('Failed to record results. Match not found or not ongoing.', 'error')
+    return redirect(url_for('admin_dashboard'))
+
+# --- Main Execution Block ---
+if __name__ == '__main__':
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if not os.path.exists(USERS_FILE):
+        pd.DataFrame(columns=['username', 'password', 'role']).to_csv(USERS_FILE, index=False)
+    
+    # One-time seeding; skip with BOOTSTRAP_ADMIN=0 so extra processes don't
+    # re-read the users file just to re-discover the admin already exists.
+    if os.environ.get('BOOTSTRAP_ADMIN', '1') == '1':
+        users_df = read_csv(USERS_FILE)
+        if 'admin' not in users_df['username'].values:
+            append_csv_row(USERS_FILE, ['admin', generate_password_hash('adminpass', method='pbkdf2:sha256', salt_length=16), 'admin'])
+
+    # Dev server only; production runs gunicorn (see Procfile). Debug/reloader
+    # is opt-in so a stray `python app.py` on a server doesn't ship it.
+    app.run(debug=os.environ.get('FLASK_DEBUG', '1') == '1', host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))